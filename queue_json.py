@@ -0,0 +1,148 @@
+# queue_json.py
+"""Load/save helpers shared by the saved-queue scripts (whole-file and --stream)."""
+import json, os, re
+from contextlib import contextmanager, suppress
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, Optional, TextIO, Tuple, TypeVar
+
+T = TypeVar("T")
+
+try:
+    import orjson  # optional: much faster load/save on big queues
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import ijson  # type: ignore[import-untyped]  # optional: only needed for --stream
+except ImportError:
+    ijson = None
+
+HAS_IJSON = ijson is not None
+
+# orjson reads integers outside [-2**63, 2**64 - 1] as floats instead of failing, so send anything
+# that might be one (20+ digits, or a minus sign and 19+) to stdlib json
+_LONG_INT_RE = re.compile(rb"-\d{19}|\d{20}")
+
+# Whole-file bytes in, whole-file bytes out: one read()/write() and one parser/encoder call each
+def read_json(path: str) -> Tuple[Any, bool]:
+    """Load a queue; returns (doc, orjson_ok). orjson_ok is False when only stdlib json could
+       read it exactly (NaN/Infinity, huge integers) and it should be written back with it too.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    if orjson is not None and not _LONG_INT_RE.search(raw):
+        try:
+            return orjson.loads(raw), True
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(raw), False
+
+def write_json(doc: Any, path: str, pretty: bool = False, use_orjson: bool = True) -> None:
+    if orjson is not None and use_orjson:
+        raw = orjson.dumps(doc, option=orjson.OPT_INDENT_2 if pretty else 0)
+    elif pretty:
+        raw = json.dumps(doc, indent=2, ensure_ascii=False).encode("utf-8")
+    else:
+        raw = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(raw)
+
+@contextmanager
+def replace_on_success(path: str) -> Iterator[TextIO]:
+    """Open a temporary text file next to `path` and move it over `path` only once the
+       block finishes, so a failed run never leaves a half-written queue.
+    """
+    tmp_path = f"{path}.partial"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+def _dumps(value: Any) -> str:
+    if orjson is not None:
+        try:
+            return orjson.dumps(value).decode("utf-8")
+        except TypeError:
+            pass  # integers beyond 64 bits; stdlib json keeps them exact
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+def _build_value(events: Iterator[Tuple[str, str, Any]], first: Tuple[str, str, Any]) -> Any:
+    """Assemble one complete JSON value from ijson events, starting at `first`."""
+    builder = ijson.ObjectBuilder()
+    depth = 0
+    _, event, value = first
+    while True:
+        builder.event(event, value)
+        if event in ("start_map", "start_array"):
+            depth += 1
+        elif event in ("end_map", "end_array"):
+            depth -= 1
+        if depth == 0:
+            return builder.value
+        _, event, value = next(events)
+
+def stream_queue_items(f_in: BinaryIO, f_out: TextIO, sections: Iterable[str],
+                       parse: Optional[Callable[..., Any]] = None) -> Iterator[Any]:
+    """Copy a saved queue from f_in (binary) to f_out (text) one item at a time.
+       Items of the given sections are yielded, in file order, so the caller can edit
+       them in place before they are written; everything else passes through unchanged.
+       Only one item is held in memory at a time. `parse` picks the ijson backend
+       (default: the fastest one installed).
+    """
+    sections = set(sections)
+    events = (parse or ijson.parse)(f_in, use_float=True)
+    _, event, _ = next(events)
+    if event != "start_map":
+        raise ValueError("Saved queue must be a JSON object at the top level")
+    write = f_out.write
+    write("{")
+    sep = "\n"
+    for _, event, key in events:
+        if event == "end_map":
+            break
+        write(f"{sep}{_dumps(key)}: ")
+        sep = ",\n"
+        first = next(events)
+        if key in sections and first[1] == "start_array":
+            write("[")
+            item_sep = "\n"
+            for ev in events:
+                if ev[1] == "end_array":
+                    break
+                item = _build_value(events, ev)
+                yield item
+                write(f"{item_sep}{_dumps(item)}")
+                item_sep = ",\n"
+            write("\n]")
+        else:
+            write(_dumps(_build_value(events, first)))
+    write("\n}\n")
+
+def stream_queue(in_path: str, out_path: Optional[str], sections: Iterable[str],
+                 process: Callable[[Iterator[Any]], T]) -> T:
+    """Copy the queue at in_path to out_path (None: parse only, write nothing), handing the
+       items of `sections` to `process` as they stream by; returns what `process` returns.
+       Raises ValueError, with a hint to rerun without --stream, if the file can't be streamed
+       (e.g. NaN/Infinity, which stdlib json accepts but ijson doesn't).
+
+       ijson's C backend is several times faster but overflows on integers >= 2**63, which
+       KSampler seeds reach. On that error the whole run starts over, with fresh `process`
+       state, on the pure-Python backend; the .partial output makes the restart safe.
+    """
+    parsers = [ijson.parse]
+    if ijson.backend != "python":
+        parsers.append(ijson.get_backend("python").parse)
+    for parse in parsers:
+        try:
+            with open(in_path, "rb") as f_in, \
+                    (replace_on_success(out_path) if out_path else open(os.devnull, "w")) as f_out:
+                return process(stream_queue_items(f_in, f_out, sections, parse))
+        except ijson.JSONError as e:
+            detail = str(e).splitlines()[0]
+            if "integer overflow" in detail and parse is not parsers[-1]:
+                continue
+            raise ValueError(f"--stream can't read this queue ({detail}); rerun without --stream") from e
+    raise AssertionError("unreachable")
@@ -1,32 +1,109 @@
 # reframe_queue_and_prefixes.py
 import argparse, json, os, re
-from copy import deepcopy
+from functools import lru_cache
+
+from queue_json import HAS_IJSON, read_json, stream_queue, write_json
+
+QUEUE_SECTIONS = ("queue_running", "queue_pending", "queue_failed")
+
+# Existing '-###f' segment just before optional '###steps' or end of the prefix
+_FRAMES_RE = re.compile(r'-(\d+)f(?=(\d+steps)?$)')
 
 def rewrite_prefix(prefix: str, frames: int) -> str:
     """Ensure the prefix contains '-{frames}f' (replace existing '-###f' if present)."""
     if not isinstance(prefix, str):
         return prefix
-    # Replace existing '-###f' just before optional 'steps' or end
-    new = re.sub(r'-(\d+)f(?=(\d+steps)?$)', f'-{frames}f', prefix)
-    if new == prefix:
-        # If there wasn't a -###f segment, append one
-        new = f"{prefix}-{frames}f"
-    return new
+    return _make_rewriter(frames)(prefix)
+
+@lru_cache(maxsize=None)
+def _make_rewriter(frames: int):
+    """
+    Build a prefix rewriter specialized to one frame count: the '-{frames}f'
+    replacement is formatted once, and results are cached per prefix since
+    queued variants of one workflow share the same prefix.
+    """
+    suffix = f'-{frames}f'
+    sub = _FRAMES_RE.sub
+
+    @lru_cache(maxsize=8192)
+    def rewrite(prefix: str) -> str:
+        # Replace existing '-###f' just before optional 'steps' or end
+        new = sub(suffix, prefix)
+        if new == prefix:
+            # If there wasn't a -###f segment, append one
+            new = prefix + suffix
+        return new
+    return rewrite
+
+def _set_length(node: dict, frames: int, rewrite):
+    """Set length on EmptyHunyuanLatentVideo."""
+    inputs = node.setdefault("inputs", {})
+    inputs["length"] = int(frames)
+
+def _set_prefix(node: dict, frames: int, rewrite):
+    """Rewrite filename_prefix on SaveVideo / SaveImage."""
+    inputs = node.setdefault("inputs", {})
+    if isinstance(inputs.get("filename_prefix"), str):
+        inputs["filename_prefix"] = rewrite(inputs["filename_prefix"])
+
+def _set_widget_length(wv: list, frames: int, rewrite):
+    """EmptyHunyuanLatentVideo widgets_values = [w, h, length, batch]."""
+    if len(wv) >= 3:
+        wv[2] = int(frames)
+
+def _set_widget_prefix(wv: list, frames: int, rewrite):
+    """SaveVideo / SaveImage first widget is filename_prefix."""
+    if wv and isinstance(wv[0], str):
+        wv[0] = rewrite(wv[0])
+
+# node type -> (graph node handler, UI widgets_values handler), shared by both walks;
+# every other node type is skipped with one lookup
+_HANDLERS = {
+    "EmptyHunyuanLatentVideo": (_set_length, _set_widget_length),
+    "SaveVideo": (_set_prefix, _set_widget_prefix),
+    "SaveImage": (_set_prefix, _set_widget_prefix),
+}
+
+# API-format graph node as serialized: a flat "inputs" object followed by a class_type we handle
+_NODE_TEXT_RE = re.compile(
+    r'("inputs"\s*:\s*)(\{[^{}]*\})(\s*,\s*"class_type"\s*:\s*"('
+    + "|".join(map(re.escape, _HANDLERS))
+    + r')")'
+)
+# Every handled node in the text, whatever its layout; used to catch nodes _NODE_TEXT_RE can't patch
+_CLASS_TEXT_RE = re.compile(r'"class_type"\s*:\s*"(?:' + "|".join(map(re.escape, _HANDLERS)) + r')"')
 
-def fix_graph_nodes(graph_dict: dict, frames: int):
+def fix_graph_nodes(graph_dict: dict, frames: int, rewrite=None):
+    rewrite = rewrite or _make_rewriter(frames)
     for node in graph_dict.values():
-        # 1) Set length on EmptyHunyuanLatentVideo
-        if node.get("class_type") == "EmptyHunyuanLatentVideo":
-            inputs = node.setdefault("inputs", {})
-            inputs["length"] = int(frames)
-
-        # 2) Rewrite filename_prefix on SaveVideo / SaveImage
-        if node.get("class_type") in ("SaveVideo", "SaveImage"):
-            inputs = node.setdefault("inputs", {})
-            if "filename_prefix" in inputs:
-                inputs["filename_prefix"] = rewrite_prefix(inputs["filename_prefix"], frames)
-
-def fix_workflow_nodes(meta: dict, frames: int):
+        handlers = _HANDLERS.get(node.get("class_type"))
+        if handlers:
+            handlers[0](node, frames, rewrite)
+
+def reframe_text(text: str, frames: int) -> str:
+    """
+    Fast path: patch graph nodes directly in the serialized queue, without
+    parsing the rest of the document. Only the executable graph is touched;
+    the UI copy in extra_pnginfo.workflow keeps its old widget values.
+    Raises ValueError if some handled node isn't laid out in a way it can patch.
+    """
+    # Cheap substring check first: queues without any handled node skip the regex scan
+    if not any(f'"{ct}"' in text for ct in _HANDLERS):
+        return text
+
+    rewrite = _make_rewriter(frames)
+
+    def repl(m):
+        node = {"inputs": json.loads(m.group(2))}
+        _HANDLERS[m.group(4)][0](node, frames, rewrite)
+        return m.group(1) + json.dumps(node["inputs"], ensure_ascii=False) + m.group(3)
+    new, patched = _NODE_TEXT_RE.subn(repl, text)
+    expected = sum(1 for _ in _CLASS_TEXT_RE.finditer(text))
+    if patched != expected:
+        raise ValueError(f"--fast could only patch {patched} of {expected} nodes; rerun without --fast")
+    return new
+
+def fix_workflow_nodes(meta: dict, frames: int, rewrite=None):
     """
     In extra_pnginfo.workflow.nodes[], mirror the UI knobs:
       - EmptyHunyuanLatentVideo: widgets_values = [w, h, length, batch]
@@ -39,38 +116,44 @@ def fix_workflow_nodes(meta: dict, frames: int):
     if not isinstance(nodes, list):
         return
 
+    rewrite = rewrite or _make_rewriter(frames)
     for n in nodes:
-        ntype = n.get("type")
-        wv = n.get("widgets_values")
-        # EmptyHunyuanLatentVideo length sits at index 2
-        if ntype == "EmptyHunyuanLatentVideo" and isinstance(wv, list) and len(wv) >= 3:
-            wv[2] = int(frames)
-        # SaveVideo / SaveImage first widget is filename_prefix
-        if ntype in ("SaveVideo", "SaveImage") and isinstance(wv, list) and len(wv) >= 1:
-            if isinstance(wv[0], str):
-                wv[0] = rewrite_prefix(wv[0], frames)
-
-def fix_job_entry(job_entry, frames: int):
+        handlers = _HANDLERS.get(n.get("type"))
+        if handlers:
+            wv = n.get("widgets_values")
+            if isinstance(wv, list):
+                handlers[1](wv, frames, rewrite)
+
+def _unpack_job(job_entry):
+    """Return (index 2, index 3) of a job entry; (None, None) if it isn't job-shaped."""
+    try:
+        return job_entry[2], (job_entry[3] if len(job_entry) >= 4 else None)
+    except (TypeError, IndexError, KeyError):
+        return None, None
+
+def fix_job_entry(job_entry, frames: int, rewrite=None):
     """
     Each job looks like: [number, uuid, GRAPH_DICT, META_DICT, [...outputs...]]
     We touch index 2 (graph) and index 3 (meta) if present.
+    Pass `rewrite` (from _make_rewriter) to reuse one prefix rewriter across jobs.
     """
-    if not isinstance(job_entry, list):
-        return
+    rewrite = rewrite or _make_rewriter(frames)
+    graph, meta = _unpack_job(job_entry)
     # Graph dict at index 2
-    if len(job_entry) >= 3 and isinstance(job_entry[2], dict):
-        fix_graph_nodes(job_entry[2], frames)
+    if isinstance(graph, dict):
+        fix_graph_nodes(graph, frames, rewrite)
     # Meta dict at index 3
-    if len(job_entry) >= 4 and isinstance(job_entry[3], dict):
-        fix_workflow_nodes(job_entry[3], frames)
+    if isinstance(meta, dict):
+        fix_workflow_nodes(meta, frames, rewrite)
 
 def process_saved_queue(data: dict, frames: int):
+    rewrite = _make_rewriter(frames)
     # Known queues to traverse
-    for key in ("queue_running", "queue_pending", "queue_failed"):
+    for key in QUEUE_SECTIONS:
         arr = data.get(key)
         if isinstance(arr, list):
             for job in arr:
-                fix_job_entry(job, frames)
+                fix_job_entry(job, frames, rewrite)
     return data
 
 def main():
@@ -78,23 +161,54 @@ def main():
     ap.add_argument("--file", required=True, help="Path to the saved queue JSON")
     ap.add_argument("--frames", type=int, default=145, help="Target frame length (default: 145)")
     ap.add_argument("--out", help="Optional explicit output path (defaults to <stem>.frames{N}.json)")
+    mode = ap.add_mutually_exclusive_group()
+    mode.add_argument("--stream", action="store_true",
+                      help="Process one job at a time to keep memory low; slower than the default "
+                           "(needs ijson)")
+    mode.add_argument("--fast", action="store_true",
+                      help="Patch the graph straight in the JSON text without parsing it; "
+                           "leaves the UI widget values untouched")
+    ap.add_argument("--pretty", action="store_true",
+                    help="Indent the output JSON (default: compact; not used by --stream/--fast)")
     args = ap.parse_args()
 
     in_path = args.file
     out_path = args.out
     frames = int(args.frames)
 
-    with open(in_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    updated = process_saved_queue(deepcopy(data), frames)
-
     if not out_path:
         base, ext = os.path.splitext(in_path)
         out_path = f"{base}.frames{frames}{ext or '.json'}"
 
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(updated, f, indent=2, ensure_ascii=False)
+    if args.stream:
+        if not HAS_IJSON:
+            ap.error("--stream needs the ijson package (pip install ijson)")
+        if os.path.abspath(out_path) == os.path.abspath(in_path):
+            ap.error("--stream cannot write over its own input; pass a different --out")
+        rewrite = _make_rewriter(frames)
+
+        def fix_jobs(jobs):
+            for job in jobs:
+                fix_job_entry(job, frames, rewrite)
+        try:
+            stream_queue(in_path, out_path, QUEUE_SECTIONS, fix_jobs)
+        except ValueError as e:
+            raise SystemExit(f"❌ {e}")
+    elif args.fast:
+        # newline="" both ways so the line endings of a file we mostly don't touch are kept
+        with open(in_path, "r", encoding="utf-8", newline="") as f:
+            text = f.read()
+        try:
+            text = reframe_text(text, frames)
+        except ValueError as e:
+            raise SystemExit(f"❌ {e}")
+        with open(out_path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+    else:
+        data, orjson_ok = read_json(in_path)
+        # `data` is discarded after writing, so edit it in place rather than copying
+        updated = process_saved_queue(data, frames)
+        write_json(updated, out_path, pretty=args.pretty, use_orjson=orjson_ok)
 
     print(f"✅ Wrote: {out_path}")
 
@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
-import argparse, json, os, sys, random
-from typing import Any, Dict, Iterable, List, Tuple
+import argparse, os, sys, random, struct
+from itertools import count
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from queue_json import HAS_IJSON, read_json, stream_queue, write_json
+
+DEFAULT_SECTIONS = ("queue_running", "queue_pending")
 
 KSAMPLER_CLASSES = {
     "KSampler",
@@ -12,104 +17,90 @@ KSAMPLER_CLASSES = {
     "SamplerCustom",
 }
 
-def iter_queue_items(doc: Dict[str, Any], which: Iterable[str] = ("queue_running","queue_pending")):
-    """Yield (section_name, index_in_section, queue_item) for each item."""
+def iter_queue_items(doc: Dict[str, Any],
+                     which: Iterable[str] = DEFAULT_SECTIONS) -> Iterator[Tuple[str, int, Any]]:
+    """Yield (section_name, index_in_section, queue_item) for each item.
+       Items are not shape-checked here; iter_nodes_from_item yields nothing for malformed ones.
+    """
     for section in which:
         items = doc.get(section, [])
         if not isinstance(items, list):
             continue
         for idx, item in enumerate(items):
-            # Expect item like [priority/int, job_id/str, nodes_dict, outputs?]
-            if isinstance(item, list) and len(item) >= 3 and isinstance(item[2], dict):
-                yield section, idx, item
-            else:
-                # Some tools might store dicts directly
-                if isinstance(item, dict):
-                    yield section, idx, item
-
-def iter_nodes_from_item(item: Any) -> Iterable[Tuple[str, Dict[str, Any]]]:
-    """Yield (node_id, node_obj) for each node in a queue item, best-effort across common formats."""
-    # Standard Save/Load Queue item: [prio, uuid, nodes_dict, ...]
-    if isinstance(item, list) and len(item) >= 3 and isinstance(item[2], dict):
-        nodes = item[2]
-        for nid, node in nodes.items():
-            if isinstance(node, dict):
-                yield str(nid), node
-    # Fallback: item is itself a nodes dict (rare), e.g. {"3":{...},...}
-    elif isinstance(item, dict):
-        for nid, node in item.items():
-            if isinstance(node, dict):
-                yield str(nid), node
-
-def find_seed_fields(node: Dict[str, Any]) -> List[Tuple[List[str], int]]:
-    """Return list of ([path_keys], current_seed_int) for all seed-like fields we intend to edit.
-       Currently: node['inputs']['seed'] when class_type is in KSAMPLER_CLASSES.
+            yield section, idx, item
+
+def iter_nodes_from_item(item: Any) -> Iterator[Tuple[str, Any]]:
+    """Yield (node_id, node_obj) for each node in a queue item, best-effort across common formats.
+       Nodes are yielded as stored (JSON object keys are already strings);
+       consumers skip anything that isn't node-shaped.
     """
-    out = []
-    cls = node.get("class_type")
-    if cls in KSAMPLER_CLASSES:
-        ins = node.get("inputs", {})
-        if isinstance(ins, dict) and "seed" in ins:
-            try:
-                val = int(ins["seed"])
-                out.append((["inputs","seed"], val))
-            except Exception:
-                pass
-    return out
-
-def apply_seed(node: Dict[str, Any], path: List[str], new_seed: int) -> None:
-    cur = node
-    for k in path[:-1]:
-        if isinstance(cur, dict) and k in cur:
-            cur = cur[k]
-        else:
+    # Standard Save/Load Queue item: [prio, uuid, nodes_dict, ...]
+    try:
+        nodes = item[2].items()
+    except (TypeError, AttributeError, KeyError, IndexError):
+        # Fallback: item is itself a nodes dict (rare), e.g. {"3":{...},...}
+        try:
+            nodes = item.items()
+        except AttributeError:
             return
-    last = path[-1]
-    if isinstance(cur, dict) and last in cur:
-        cur[last] = int(new_seed)
+    yield from nodes
+
+def random_seeds(rnd: random.Random, batch: int = 4096) -> Iterator[int]:
+    """Endless stream of the same seeds repeated rnd.randint(0, 2**31 - 1) calls would give.
+       randint draws 32-bit words and rejects those >= 2**31; getrandbits(32 * n) returns those
+       same words lowest-first, so we draw them in bulk and apply the rejection ourselves.
+    """
+    while True:
+        words = rnd.getrandbits(32 * batch).to_bytes(4 * batch, "little")
+        for (w,) in struct.iter_unpack("<I", words):
+            if w < 2_147_483_648:
+                yield w
 
 def reseed_document(doc: Dict[str, Any], mode: str, *, start: int = 0, step: int = 1,
-                    scope: str = "global", rng_seed: int = None,
-                    only_sections: List[str] = None) -> Tuple[int,int]:
+                    scope: str = "global", rng_seed: Optional[int] = None,
+                    only_sections: Optional[List[str]] = None) -> Tuple[int,int]:
     """Reseed in place. Returns (nodes_touched, seeds_changed)."""
+    valid_sections = DEFAULT_SECTIONS if not only_sections else tuple(only_sections)
+    items = (item for _section, _idx, item in iter_queue_items(doc, which=valid_sections))
+    return reseed_items(items, mode, start=start, step=step, scope=scope, rng_seed=rng_seed)
+
+def reseed_items(items: Iterable[Any], mode: str, *, start: int = 0, step: int = 1,
+                 scope: str = "global", rng_seed: Optional[int] = None) -> Tuple[int,int]:
+    """Reseed each queue item in place, in iteration order. Returns (nodes_touched, seeds_changed)."""
+    if mode not in ("random", "increment"):
+        raise ValueError("Unknown mode: %r" % mode)
     rnd = random.Random(rng_seed) if rng_seed is not None else random.Random()
+    # Seeds come from an endless iterator picked once per run, so the inner loop is just next()
+    if mode == "random":
+        seeds = random_seeds(rnd)
+        per_job = False
+    else:
+        seeds = count(start, step)
+        per_job = scope == "job"
     nodes_touched = 0
     seeds_changed = 0
-    seq_val = start
-
-    valid_sections = ("queue_running","queue_pending") if not only_sections else tuple(only_sections)
-    # If scope is per-job, we reset seq_val at each job
-    for section, idx, item in iter_queue_items(doc, which=valid_sections):
-        job_seed = start
-        def next_seq():
-            nonlocal seq_val, job_seed
-            if scope == "job":
-                v = job_seed
-                job_seed += step
-                return v
-            else:
-                v = seq_val
-                seq_val += step
-                return v
-
-        for nid, node in iter_nodes_from_item(item):
-            fields = find_seed_fields(node)
-            if not fields:
+
+    for item in items:
+        # If scope is per-job, we restart the counter at each job
+        if per_job:
+            seeds = count(start, step)
+        for _nid, node in iter_nodes_from_item(item):
+            # The seed field we edit: node['inputs']['seed'] when class_type is in KSAMPLER_CLASSES
+            try:
+                if node.get("class_type") not in KSAMPLER_CLASSES:
+                    continue
+                ins = node.get("inputs", {})
+                cur_seed = int(ins["seed"])
+            except Exception:
                 continue
             nodes_touched += 1
-            for path, cur_seed in fields:
-                if mode == "random":
-                    new_seed = rnd.randint(0, 2_147_483_647)
-                elif mode == "increment":
-                    new_seed = next_seq()
-                else:
-                    raise ValueError("Unknown mode: %r" % mode)
-                if int(new_seed) != int(cur_seed):
-                    apply_seed(node, path, new_seed)
-                    seeds_changed += 1
+            new_seed = next(seeds)
+            if new_seed != cur_seed:
+                ins["seed"] = new_seed
+                seeds_changed += 1
     return nodes_touched, seeds_changed
 
-def main():
+def main() -> None:
     ap = argparse.ArgumentParser(description="Reseed ComfyUI Save/Load Queue JSON (KSampler seeds).")
     ap.add_argument("--in", dest="input_path", required=True, help="Path to input queue JSON")
     ap.add_argument("--out", dest="output_path", required=True, help="Where to write the reseeded JSON")
@@ -122,23 +113,45 @@ def main():
     ap.add_argument("--sections", nargs="*", default=None,
                     help="Only reseed these sections (default: queue_running queue_pending)")
     ap.add_argument("--dry-run", action="store_true", help="Parse and report without writing")
+    ap.add_argument("--pretty", action="store_true",
+                    help="Indent the output JSON (default: compact; not used by --stream)")
+    ap.add_argument("--stream", action="store_true",
+                    help="Process one job at a time to keep memory low; slower than the default "
+                         "(needs ijson). Sections are visited in file order")
     args = ap.parse_args()
 
-    with open(args.input_path, "r", encoding="utf-8") as f:
-        doc = json.load(f)
+    if args.stream:
+        if not HAS_IJSON:
+            ap.error("--stream needs the ijson package (pip install ijson)")
+        if not args.dry_run and os.path.abspath(args.output_path) == os.path.abspath(args.input_path):
+            ap.error("--stream cannot write over its own input; pass a different --out")
+        if not args.dry_run:
+            # Ensure output directory exists
+            os.makedirs(os.path.dirname(os.path.abspath(args.output_path)), exist_ok=True)
+        try:
+            nodes_touched, seeds_changed = stream_queue(
+                args.input_path, None if args.dry_run else args.output_path,
+                args.sections or DEFAULT_SECTIONS,
+                lambda items: reseed_items(items, args.mode, start=args.start, step=args.step,
+                                           scope=args.scope, rng_seed=args.rng_seed)
+            )
+        except ValueError as e:
+            sys.exit(f"Error: {e}")
+    else:
+        doc, orjson_ok = read_json(args.input_path)
 
-    nodes_touched, seeds_changed = reseed_document(
-        doc, args.mode, start=args.start, step=args.step, scope=args.scope,
-        rng_seed=args.rng_seed, only_sections=args.sections
-    )
+        nodes_touched, seeds_changed = reseed_document(
+            doc, args.mode, start=args.start, step=args.step, scope=args.scope,
+            rng_seed=args.rng_seed, only_sections=args.sections
+        )
 
     print(f"Nodes touched: {nodes_touched}, seed fields changed: {seeds_changed}")
 
     if not args.dry_run:
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(os.path.abspath(args.output_path)), exist_ok=True)
-        with open(args.output_path, "w", encoding="utf-8") as f:
-            json.dump(doc, f, indent=2)
+        if not args.stream:
+            # Ensure output directory exists
+            os.makedirs(os.path.dirname(os.path.abspath(args.output_path)), exist_ok=True)
+            write_json(doc, args.output_path, pretty=args.pretty, use_orjson=orjson_ok)
         print(f"Wrote: {args.output_path}")
     else:
         print("Dry run; no file written.")